@@ -55,6 +55,13 @@ except ImportError:
           'astroquery')
     sys.exit()
 
+# fitsio is optional; if available, it is used to speed up reading
+# FITS_LDAC files
+try:
+    import fitsio
+except ImportError:
+    fitsio = None
+
 # translates numpy datatypes to sql-readable datatypes
 sql.register_adapter(np.float64, float)
 sql.register_adapter(np.float32, float)
@@ -737,15 +744,22 @@ class catalog(object):
 
     def read_ldac(self, filename, fits_filename=None, maxflag=None,
                   time_keyword='MIDTIMJD', exptime_keyword='EXPTIME',
-                  object_keyword='OBJECT', telescope_keyword='TEL_KEYW'):
+                  object_keyword='OBJECT', telescope_keyword='TEL_KEYW',
+                  use_fitsio=False):
         """
         read in FITS_LDAC file
-        input: LDAC filename
+        input: LDAC filename; use_fitsio: read the file with fitsio,
+               if available, instead of astropy.io.fits
         return: (number of sources, number of fields)
         """
 
+        use_fitsio = use_fitsio and fitsio is not None
+
         # load LDAC file
-        hdulist = fits.open(filename, ignore_missing_end=True)
+        if use_fitsio:
+            hdulist = fitsio.FITS(filename)
+        else:
+            hdulist = fits.open(filename, ignore_missing_end=True)
 
         if len(hdulist) < 3:
             print(('ERROR: {:s} seems to be empty; check LOG file if ' +
@@ -756,12 +770,19 @@ class catalog(object):
                                filename))
             return None
 
-        # load data array
-        self.data = Table(hdulist[2].data)
+        # load data array and image header
+        if use_fitsio:
+            self.data = Table(hdulist[2].read())
+            imhead = hdulist[1].read()[0][0]
+        else:
+            self.data = Table(hdulist[2].data)
+            imhead = hdulist[1].data[0][0]
 
         # set other properties
         telescope = ''
-        for line in hdulist[1].data[0][0]:
+        for line in imhead:
+            if isinstance(line, bytes):
+                line = line.decode()
             if telescope_keyword in line:
                 telescope = line.split('\'')[1]
         self.catalogname = filename
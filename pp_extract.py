@@ -27,11 +27,11 @@ from __future__ import print_function
 import numpy
 import os
 import sys
+import errno
 import subprocess
 import logging
 import argparse
-import shlex
-from multiprocessing import Pool
+from multiprocessing import Pool, cpu_count
 from astropy.io import fits
 
 # only import if Python3 is used
@@ -69,9 +69,8 @@ version = '1.0'
 # Determine the Source Extractor executable name: sex or sextractor.
 for cmd in ['sex', 'sextractor', 'source-extractor']:
     try:
-        p = subprocess.Popen(cmd, stdout=subprocess.PIPE,
-                             stderr=subprocess.PIPE)
-        del p
+        p = subprocess.Popen(cmd, stdout=DEVNULL, stderr=DEVNULL)
+        p.wait()
         break
     except OSError:
         continue
@@ -80,16 +79,31 @@ else:
 sextractor_cmd = cmd
 del cmd
 
-# extractor class definition
+# extraction parameters of a worker process; set once per process by
+# init_worker so that they are not pickled again for every frame
+worker_param = None
 
 
-def extract_singleframe(data):
+def init_worker(param):
     """
-    call Source Extractor using multiprocessing
+    store extraction parameters in a worker process
     """
+    global worker_param
+    worker_param = param
 
-    param = data[0]
-    filename = data[1]
+
+def extract_singleframe(frame, param=None):
+    """
+    call Source Extractor on a single frame; run in a worker process
+    input: (frame index, FITS filename) tuple, parameters dictionary
+           (defaults to the parameters set by init_worker)
+    output: (frame index, result properties for this frame)
+    """
+
+    if param is None:
+        param = worker_param
+
+    index, filename = frame
 
     out = {}
 
@@ -100,46 +114,19 @@ def extract_singleframe(data):
     out['parameters'] = param
 
     # prepare running SEXTRACTOR
-    os.remove(ldacname) if os.path.exists(ldacname) else None
-
-    optionstring = ''
-    if _pp_conf.photmode == 'APER':
-        optionstring += ' -PHOT_APERTURES %s ' % \
-            param['aperture_diam']
-    if ('global_background' in param and
-            param['global_background']):
-        optionstring += ' -BACKPHOTO_TYPE GLOBAL '
-    else:
-        optionstring += ' -BACKPHOTO_TYPE LOCAL '
-    optionstring += ' -DETECT_MINAREA %f ' % param['source_minarea']
-    optionstring += ' -DETECT_THRESH %f -ANALYSIS_THRESH %f ' % \
-                    (param['sex_snr'], param['sex_snr'])
-    optionstring += ' -CATALOG_NAME %s ' % ldacname
-
-    if 'mask_file' in param:
-        optionstring += ' -WEIGHT_TYPE MAP_WEIGHT'
-        optionstring += ' -WEIGHT_IMAGE %s' % param['mask_file']
-
-    if 'paramfile' in param:
-        optionstring += ' -PARAMETERS_NAME %s' % param['paramfile']
-
-    if 'ignore_saturation' in param:
-        if param['ignore_saturation']:
-            optionstring += ' -SATUR_LEVEL 1000000'
-            optionstring += ' -SATUR_KEY NOPE'
-
-    if 'nodeblending' in param and param['nodeblending']:
-        optionstring += ' -DEBLEND_MINCONT 1 '
+    try:
+        os.remove(ldacname)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
 
-    commandline = '%s -c %s %s %s' % \
-                  (sextractor_cmd,
-                   param['obsparam']['sex-config-file'],
-                   optionstring, filename)
-    logging.info('call Source Extractor as: %s' % commandline)
+    commandline = ([sextractor_cmd] + param['sex_options'] +
+                   ['-CATALOG_NAME', ldacname, filename])
+    logging.info('call Source Extractor as: %s', ' '.join(commandline))
 
     # run SEXTRACTOR and wait for it to finish
     try:
-        sex = subprocess.Popen(shlex.split(commandline),
+        sex = subprocess.Popen(commandline,
                                stdout=DEVNULL,
                                stderr=DEVNULL,
                                close_fds=True)
@@ -148,8 +135,8 @@ def extract_singleframe(data):
         # subprocess.Popen
     except Exception as e:
         print('Source Extractor call:', (e))
-        logging.error('Source Extractor call:', (e))
-        return None
+        logging.error('Source Extractor call: %s', e)
+        return index, None
 
     sex.wait()
 
@@ -159,66 +146,30 @@ def extract_singleframe(data):
 
     if not os.path.exists(ldac_filename):
         print('No Source Extractor output for frame', filename)
-        logging.error('No Source Extractor output')
-        return None
+        logging.error('No Source Extractor output for frame %s', filename)
+        return index, None
 
     # make sure ldac file contains data
-    if ldac_data.read_ldac(ldac_filename, maxflag=None) is None:
+    if ldac_data.read_ldac(ldac_filename, maxflag=None,
+                           use_fitsio=True) is None:
         print('LDAC file empty', filename, end=' ')
-        logging.error('LDAC file empty: ' + sex_output)
-        return None
+        logging.error('LDAC file empty: %s', ldac_filename)
+        return index, None
 
     out['catalog_data'] = ldac_data
 
-    # update image header with aperture radius and other information
-    hdu = fits.open(filename, mode='update', ignore_missing_end=True)
-    obsparam = param['obsparam']
-    # observation midtime
-    if obsparam['obsmidtime_jd'] in hdu[0].header:
-        midtimjd = hdu[0].header[obsparam['obsmidtime_jd']]
-    else:
-        if obsparam['date_keyword'].find('|') == -1:
-            midtimjd = dateobs_to_jd(
-                hdu[0].header[obsparam['date_keyword']]) + \
-                float(hdu[0].header[obsparam['exptime']])/2./86400.
-        else:
-            datetime = hdu[0].header[
-                obsparam['date_keyword'].split('|')[0]] + \
-                'T'+hdu[0].header[
-                obsparam['date_keyword'].split('|')[1]]
-            midtimjd = dateobs_to_jd(datetime) + \
-                float(hdu[0].header[
-                    obsparam['exptime']])/2./86400.
-    out['time'] = midtimjd
-
-    # hdu[0].header['APRAD'] = \
-    #     (",".join([str(aprad) for aprad in self.param['aprad']]), \
-    #      'aperture phot radius (px)')
-    # hdu[0].header['SEXSNR'] = \
-    #     (self.param['sex_snr'],
-    #      'Sextractor detection SNR threshold')
-    # hdu[0].header['SEXAREA'] = \
-    #     (self.param['source_minarea'],
-    #      'Sextractor source area threshold (px)')
-    out['fits_header'] = hdu[0].header
-
-    hdu.flush()
-    hdu.close()
-
-    logging.info("%d sources extracted from frame %s" %
-                 (len(ldac_data.data), filename))
-    if not param['quiet']:
-        print("%d sources extracted from frame %s" %
-              (len(ldac_data.data), filename))
-
-    return out
+    logging.info('%d sources extracted from frame %s',
+                 len(ldac_data.data), filename)
+
+    return index, out
 
 
 def extract_multiframe(filenames, parameters):
     """
     wrapper to run multi-threaded source extraction
     input: FITS filenames, parameters dictionary: telescope, obsparam, aprad,
-                                                  quiet, sex_snr, source_minarea
+                                                  quiet, sex_snr, source_minarea,
+                                                  nthreads (optional)
     output: result properties
     """
 
@@ -226,12 +177,15 @@ def extract_multiframe(filenames, parameters):
                  len(filenames))
     logging.info('extraction parameters: %s' % repr(parameters))
 
-    # obtain telescope information from image header or override manually
-    hdu = fits.open(filenames[0], ignore_missing_end=True, verify='silentfix')
+    # read all headers once up front; workers only run Source Extractor
+    # and parse the resulting LDAC files
+    headers = [fits.getheader(filename, ignore_missing_end=True)
+               for filename in filenames]
 
+    # obtain telescope information from image header or override manually
     if 'telescope' not in parameters or parameters['telescope'] is None:
         try:
-            parameters['telescope'] = hdu[0].header['TEL_KEYW']
+            parameters['telescope'] = headers[0]['TEL_KEYW']
         except KeyError:
             logging.critical('ERROR: TEL_KEYW not in image header (%s)' %
                              filenames[0])
@@ -248,41 +202,105 @@ def extract_multiframe(filenames, parameters):
 
     # set aperture photometry DIAMETER as string
     if _pp_conf.photmode == 'APER':
-        if ((type(parameters['aprad']) == float and
-             parameters['aprad'] == 0)
-            or (type(parameters['aprad']) == list
-                and len(parameters['aprad']) == 0)):
+        aprad = numpy.atleast_1d(numpy.asarray(parameters['aprad'],
+                                               dtype=float))
+        if len(aprad) == 0 or (len(aprad) == 1 and aprad[0] == 0):
             parameters['aperture_diam'] = str(parameters['obsparam']
                                               ['aprad_default']*2)
         else:
-            if not isinstance(parameters['aprad'], list) and \
-               not isinstance(parameters['aprad'], numpy.ndarray):
-                parameters['aprad'] = [str(parameters['aprad'])]
-            parameters['aperture_diam'] = ','.join([str(float(rad)*2.)
-                                                    for rad in
-                                                    parameters['aprad']])
+            parameters['aperture_diam'] = ','.join([str(diam) for diam in
+                                                    (aprad*2.).tolist()])
 
     # check what the binning is and if there is a mask available
-    binning = get_binning(hdu[0].header, parameters['obsparam'])
+    binning = get_binning(headers[0], parameters['obsparam'])
     bin_string = '%d,%d' % (binning[0], binning[1])
 
     if bin_string in parameters['obsparam']['mask_file']:
         mask_file = parameters['obsparam']['mask_file'][bin_string]
         parameters['mask_file'] = mask_file
 
-    hdu.close()
+    # assemble Source Extractor options that are the same for all frames
+    options = ['-c', parameters['obsparam']['sex-config-file']]
+    if _pp_conf.photmode == 'APER':
+        options += ['-PHOT_APERTURES', parameters['aperture_diam']]
+    if ('global_background' in parameters and
+            parameters['global_background']):
+        options += ['-BACKPHOTO_TYPE', 'GLOBAL']
+    else:
+        options += ['-BACKPHOTO_TYPE', 'LOCAL']
+    options += ['-DETECT_MINAREA', '%f' % parameters['source_minarea']]
+    options += ['-DETECT_THRESH', '%f' % parameters['sex_snr'],
+                '-ANALYSIS_THRESH', '%f' % parameters['sex_snr']]
+
+    if 'mask_file' in parameters:
+        options += ['-WEIGHT_TYPE', 'MAP_WEIGHT',
+                    '-WEIGHT_IMAGE', parameters['mask_file']]
+
+    if 'paramfile' in parameters:
+        options += ['-PARAMETERS_NAME', parameters['paramfile']]
+
+    if 'ignore_saturation' in parameters:
+        if parameters['ignore_saturation']:
+            options += ['-SATUR_LEVEL', '1000000',
+                        '-SATUR_KEY', 'NOPE']
+
+    if 'nodeblending' in parameters and parameters['nodeblending']:
+        options += ['-DEBLEND_MINCONT', '1']
 
-    # thread and queue handling
+    parameters['sex_options'] = options
 
-    pool = Pool()
-    data = [(parameters, filename) for filename in filenames]
-    output = pool.map(extract_singleframe, data)
+    # derive observation midtimes from the headers; date and time may be
+    # stored in separate keywords (date_keyword: 'DATE|TIME')
+    obsparam = parameters['obsparam']
+    if '|' in obsparam['date_keyword']:
+        date_keyword, time_keyword = obsparam['date_keyword'].split('|')
+
+        def get_datetime(header):
+            return header[date_keyword]+'T'+header[time_keyword]
+    else:
+        def get_datetime(header):
+            return header[obsparam['date_keyword']]
+
+    midtimes = []
+    for header in headers:
+        if obsparam['obsmidtime_jd'] in header:
+            midtimes.append(header[obsparam['obsmidtime_jd']])
+        else:
+            midtimes.append(dateobs_to_jd(get_datetime(header)) +
+                            float(header[obsparam['exptime']])/2./86400.)
+
+    # use one process per core, unless set manually
+    if 'nthreads' in parameters and parameters['nthreads'] is not None:
+        nthreads = parameters['nthreads']
+    else:
+        nthreads = cpu_count()
+    nthreads = max(1, min(nthreads, len(filenames)))
+
+    # process frames in parallel; results are stored by frame index, so
+    # that the output order matches the order of filenames
+    output = [None]*len(filenames)
+    pool = Pool(processes=nthreads, initializer=init_worker,
+                initargs=(parameters,))
+    try:
+        for index, out in pool.imap_unordered(
+                extract_singleframe,
+                [(i, filenames[i]) for i in range(len(filenames))]):
+            output[index] = out
+            if out is not None and not parameters['quiet']:
+                print('%d sources extracted from frame %s' %
+                      (len(out['catalog_data'].data), out['fits_filename']))
+    finally:
+        pool.close()
+        pool.join()
 
     # check if extraction was successful
-    if any(['catalog_data' not in list(output[i].keys())
-            for i in range(len(output))]):
+    if any([out is None for out in output]):
         return None
 
+    for i, out in enumerate(output):
+        out['time'] = midtimes[i]
+        out['fits_header'] = headers[i]
+
     # output content
     #
     # { 'fits_filename': fits filename,